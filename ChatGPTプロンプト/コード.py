@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 """
 Revit 2024 / Dynamo (CPython3) 用
-グループがいくつあっても、OpenAI API の呼び出しは 1 回だけにする版。
+グループが BATCH_SIZE 個以下なら OpenAI API の呼び出しは 1 回だけ、
+それより多い場合は BATCH_SIZE 個ずつに分けて並列に呼び出す版。
 
 IN[0] : OpenAI API キー（文字列）
 IN[1] : プロンプト（今回の長文ルール）
@@ -11,12 +12,33 @@ IN[2] : 部屋名称リスト
 
 OUT  : フラットな 1 本のリスト
        [{'名前':..., 'ID':...}, {'名前':..., 'ID':...}, ...]
+
+依存  : 標準ライブラリのみで動作します。
+        urllib3 がインストールされていれば接続プール（HTTPS 接続の再利用）と
+        gzip 応答を使い、無ければ標準の urllib.request で 1 回ずつ接続します。
+        orjson があれば JSON パースに使います（任意）。
 """
 
 import json
 import ssl
 import urllib.request
 import urllib.error
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
+# urllib3 は任意。無い環境では urllib.request にフォールバックする。
+try:
+    import urllib3
+except ImportError:
+    urllib3 = None
+
+# orjson があれば JSON パースに使う（標準 json より高速）。無ければ標準 json。
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # ---------- 入力 ----------
 api_key = IN[0]
@@ -33,7 +55,57 @@ API_URL = "https://api.openai.com/v1/chat/completions"
 # サポートされている gpt-4o スナップショットを利用
 MODEL_NAME = "gpt-4o-2024-08-06"
 
-_ssl_context = ssl.create_default_context()
+# グループ数が多いときの分割単位と同時リクエスト数
+# （1 回のリクエストを小さくしてタイムアウト・再試行の影響範囲を抑え、往復を重ねる）
+BATCH_SIZE = 8
+MAX_WORKERS = 4
+
+# 非ストリーミングの応答は生成が終わるまで何も返ってこないため、読み取りは待ち時間を
+# 制限しない（None、元の urllib.request 呼び出しと同じ）。接続の確立だけ短く打ち切る。
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = None
+
+# 接続プールはモジュールで 1 つだけ作り、呼び出しごとの TCP + TLS ハンドシェイクを省く
+# （同じホストへの接続を使い回す）。urllib3 が無い場合は urllib.request 用の SSL 設定。
+if urllib3 is not None:
+    _HTTP = urllib3.PoolManager(
+        maxsize=MAX_WORKERS,  # 並列呼び出し数ぶんの接続を保持
+        cert_reqs="CERT_REQUIRED",
+        retries=urllib3.Retry(total=2, backoff_factor=0.2),
+    )
+else:
+    _HTTP = None
+    _ssl_context = ssl.create_default_context()
+
+
+def _post(url, data_bytes, headers):
+    """
+    POST して (status, reason, body_bytes) を返す。
+    HTTP エラー（4xx/5xx）も例外にせず status で返し、接続エラーのみ例外を送出する。
+    """
+    if _HTTP is not None:
+        # JSON テキストは圧縮がよく効くので gzip で受け取る（展開は urllib3 が行う）
+        headers = dict(headers, **{"Accept-Encoding": "gzip, deflate"})
+        resp = _HTTP.request(
+            "POST",
+            url,
+            body=data_bytes,
+            headers=headers,
+            timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT),
+            decode_content=True
+        )
+        return resp.status, resp.reason, resp.data
+
+    req = urllib.request.Request(url, data=data_bytes, headers=headers)
+    try:
+        with urllib.request.urlopen(req, context=_ssl_context) as resp:
+            return resp.status, resp.reason, resp.read()
+    except urllib.error.HTTPError as e:
+        try:
+            err_body = e.read()
+        except Exception:
+            err_body = b""
+        return e.code, e.reason, err_body
 
 
 # ---------- IN[2] から「辞書リストのグループ」だけを抜き出す ----------
@@ -48,16 +120,18 @@ def extract_groups(obj):
     """
     groups = []
 
-    def _walk(x):
+    # 再帰を使わずスタックで走査（深い入れ子でも再帰上限に当たらない）。
+    # 子要素を逆順で左端に積むので、拾う順番は再帰版と同じ。
+    stack = deque([obj])
+    while stack:
+        x = stack.popleft()
         if isinstance(x, (list, tuple)):
             if x and isinstance(x[0], dict):
                 # 1 グループ発見
                 groups.append(list(x))
             else:
-                for y in x:
-                    _walk(y)
+                stack.extendleft(reversed(x))
 
-    _walk(obj)
     return groups
 
 
@@ -163,35 +237,33 @@ def call_openai_structured_all(api_key, model, prompt_text, groups):
         "Authorization": "Bearer " + str(api_key).strip()
     }
 
-    req = urllib.request.Request(API_URL, data=data_bytes, headers=headers)
-
     # ---- HTTP 呼び出し ＋ エラーハンドリング ----
     try:
-        with urllib.request.urlopen(req, context=_ssl_context) as resp:
-            resp_text = resp.read().decode("utf-8")
-    except urllib.error.HTTPError as e:
+        status, reason, resp_data = _post(API_URL, data_bytes, headers)
+    except Exception as e:
+        return {
+            "error": "Connection error: {0}".format(e),
+            "input": groups
+        }
+
+    if status >= 400:
         try:
-            err_body = e.read().decode("utf-8")
+            err_body = resp_data.decode("utf-8")
         except Exception:
             err_body = ""
         return {
-            "error": "HTTP error: {0} {1}".format(e.code, e.reason),
+            "error": "HTTP error: {0} {1}".format(status, reason),
             "body": err_body,
             "input": groups
         }
-    except Exception as e:
-        return {
-            "error": "Connection error: {0}".format(e),
-            "input": groups
-        }
 
-    # ---- レスポンス JSON パース ----
+    # ---- レスポンス JSON パース（bytes のまま渡し、デコードはエラー時のみ） ----
     try:
-        resp_json = json.loads(resp_text)
+        resp_json = _json_loads(resp_data)
     except Exception as e:
         return {
             "error": "JSON decode error in API response: {0}".format(e),
-            "raw_response": resp_text,
+            "raw_response": resp_data.decode("utf-8", "replace"),
             "input": groups
         }
 
@@ -206,7 +278,7 @@ def call_openai_structured_all(api_key, model, prompt_text, groups):
 
     # message.content には JSON 文字列が入っている想定
     try:
-        body = json.loads(content)
+        body = _json_loads(content)
     except Exception as e:
         return {
             "error": "JSON decode error in message.content: {0}".format(e),
@@ -246,14 +318,9 @@ def flatten_groups(groups_2d):
     1 本の [{...}, {...}, ...] に変換。
     （エラー情報の dict もそのまま要素として残す）
     """
-    flat = []
-    for g in groups_2d:
-        if isinstance(g, (list, tuple)):
-            for x in g:
-                flat.append(x)
-        else:
-            flat.append(g)
-    return flat
+    return list(chain.from_iterable(
+        g if isinstance(g, (list, tuple)) else (g,) for g in groups_2d
+    ))
 
 
 # ---------- メイン処理 ----------
@@ -261,11 +328,26 @@ if not groups_in:
     # IN[2] に辞書リストが見つからなかった場合
     OUT = []
 else:
-    result_groups = call_openai_structured_all(api_key, MODEL_NAME, base_prompt, groups_in)
+    chunks = [groups_in[i:i + BATCH_SIZE] for i in range(0, len(groups_in), BATCH_SIZE)]
 
-    if isinstance(result_groups, dict) and "error" in result_groups:
-        # まとめて失敗した場合は、そのまま OUT に
-        OUT = [result_groups]
+    if len(chunks) == 1:
+        # BATCH_SIZE 以下なら従来どおり 1 回で処理
+        chunk_results = [call_openai_structured_all(api_key, MODEL_NAME, base_prompt, groups_in)]
     else:
-        # 成功した場合は 2 次元 → 1 次元にフラット化して OUT
-        OUT = flatten_groups(result_groups)
+        # 各チャンクを並列に呼び出す（結果の順番は chunks の順のまま）
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+            chunk_results = list(ex.map(
+                lambda c: call_openai_structured_all(api_key, MODEL_NAME, base_prompt, c),
+                chunks
+            ))
+
+    result_groups = []
+    for res in chunk_results:
+        if isinstance(res, dict) and "error" in res:
+            # 失敗したチャンクはエラー情報の dict をそのまま 1 要素として残す
+            result_groups.append(res)
+        else:
+            result_groups.extend(res)
+
+    # 2 次元 → 1 次元にフラット化して OUT（エラー dict はそのまま要素として残る）
+    OUT = flatten_groups(result_groups)
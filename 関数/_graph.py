@@ -0,0 +1,373 @@
+from collections import deque, defaultdict
+from typing import Dict, Hashable, Iterator, List, Tuple
+
+# 任意依存の NumPy / SciPy / Numba は、実際に使う規模のグラフが来たときに
+# use_scipy / use_numba の中で初めて import する（import _graph だけでは読み込まない）。
+# None = 未確認、True / False = 利用可否を確認済み。
+np = None
+csr_matrix = None
+shortest_path = None
+numba = None
+_brandes_csr = None  # use_numba で _brandes_csr_py を numba.njit したもの
+_have_scipy = None
+_have_numba = None
+
+# SciPy も import だけで約 0.2 秒かかるため、純 Python の全ソース BFS が
+# それを上回る規模からのみ使う（実測の損益分岐：格子・パス約 1200、ランダム約 1400 ノード）
+SCIPY_MIN_NODES = 1500
+# Numba は import とコンパイル済みキャッシュの読込だけで約 0.5 秒かかるため、
+# 純 Python の全ソース BFS がそれを上回る規模からのみ使う
+# （実測の損益分岐：格子・ランダム・パスとも約 1000 ノード）
+NUMBA_MIN_NODES = 1000
+
+# SciPy の距離行列は n×n の float64 を丸ごと持つので、要素数に上限を設ける
+# （25,000,000 要素 ≒ 200 MB、n ≒ 5000 まで）
+SCIPY_MAX_CELLS = 25_000_000
+
+# 近接中心性・媒介中心性で共通のグラフ構築と BFS。
+# 次数中心性を含め 3 つを同じグラフに対して求める場合は all_centralities() を使うと、
+# 隣接リストの構築も各ソースからの BFS も 1 回ずつで済みます。
+# （次数中心性.py 単体は隣接集合で次数を数えるだけなので _graph を使わない）
+
+
+def build(
+    edges: List[Tuple[Hashable, Hashable]],
+) -> Tuple[List[Hashable], Dict[Hashable, int], List[List[int]]]:
+    """
+    無向エッジ列から、整数添字の隣接リストを構築します。
+    自己ループ (u,u) は無視、重複エッジは1本として扱います。
+
+    Returns
+    -------
+    nodes : list
+        添字 -> ノード（エッジに初めて出現した順）
+    idx : dict
+        ノード -> 添字
+    adj : list of list of int
+        添字ごとの隣接ノード添字のリスト
+    """
+    nbrs: Dict[Hashable, set] = defaultdict(set)
+    for u, v in edges:
+        if u == v:
+            continue
+        nbrs[u].add(v)
+        nbrs[v].add(u)
+
+    nodes = list(nbrs.keys())
+    idx: Dict[Hashable, int] = {v: i for i, v in enumerate(nodes)}
+    adj: List[List[int]] = [[idx[w] for w in nbrs[v]] for v in nodes]
+    return nodes, idx, adj
+
+
+def bfs(
+    adj: List[List[int]],
+    s: int,
+    dist: List[int],
+    sigma: List[float],
+    P: List[List[int]],
+    S: List[int],
+    Q: deque,
+    paths: bool = True,
+) -> None:
+    """
+    s を始点に BFS し、dist（距離）・S（訪問順）を埋めます。
+    paths=True のときは sigma（最短路数）・P（直前ノード）も埋めます。
+    作業配列は呼び出し側で初期化済み（dist=-1, sigma=0.0, P=空, S=空）であること。
+    """
+    dist[s] = 0
+    sigma[s] = 1.0
+    Q.append(s)
+    while Q:
+        v = Q.popleft()
+        S.append(v)
+        dv = dist[v] + 1
+        if paths:
+            for w in adj[v]:
+                if dist[w] < 0:
+                    dist[w] = dv
+                    Q.append(w)
+                if dist[w] == dv:
+                    sigma[w] += sigma[v]
+                    P[w].append(v)
+        else:
+            for w in adj[v]:
+                if dist[w] < 0:
+                    dist[w] = dv
+                    Q.append(w)
+
+
+def bfs_all_sources(
+    adj: List[List[int]],
+    paths: bool = True,
+) -> Iterator[Tuple[int, List[int], List[float], List[List[int]], List[int]]]:
+    """
+    全ノードを順に始点として BFS し、(s, dist, sigma, P, S) を yield します。
+    作業配列は全ソースで使い回すため、yield された配列は次の反復で
+    書き換わります（必要な値はその場で読み取ってください）。
+    """
+    n = len(adj)
+    S: List[int] = []
+    # 直前ノードのリストも最初に n 本作るだけで、以後は clear() で中身だけ捨てる
+    # （確保済みの領域は残るので、ソースごとの小さなオブジェクト生成は起きない）。
+    # array('q') 上の連結リスト（Numba 版 _brandes_csr と同じ形）にも置き換えてみたが、
+    # CPython では要素アクセスのたびに int を生成する分 3〜4 割遅かった。
+    P: List[List[int]] = [[] for _ in range(n)]
+    sigma: List[float] = [0.0] * n
+    dist: List[int] = [-1] * n
+    Q: deque = deque()
+
+    for s in range(n):
+        bfs(adj, s, dist, sigma, P, S, Q, paths)
+        yield s, dist, sigma, P, S
+
+        # 訪問したノードの分だけ作業配列を初期化
+        for i in S:
+            sigma[i] = 0.0
+            dist[i] = -1
+            P[i].clear()
+        S.clear()
+
+
+def accumulate_dependency(
+    s: int,
+    sigma: List[float],
+    P: List[List[int]],
+    S: List[int],
+    delta: List[float],
+    Cb: List[float],
+) -> None:
+    """
+    Brandes 法の依存度の逆伝播を行い、Cb に加算します。
+    delta は全 0 で渡し、使用後は訪問ノード分だけ 0 に戻します。
+    """
+    for w in reversed(S):
+        sw = sigma[w]
+        if sw != 0.0:  # 連結でない場合の防御
+            coeff = (1.0 + delta[w]) / sw
+            for v in P[w]:
+                delta[v] += sigma[v] * coeff
+        if w != s:
+            Cb[w] += delta[w]
+    for i in S:
+        delta[i] = 0.0
+
+
+def closeness_score(total_dist: int, reachable: int, N: int, wf_improved: bool) -> float:
+    """1 ノード分の近接中心性（NetworkX と同じ定義）。"""
+    # 孤立ノード、到達先が自分だけ、または距離総和ゼロ（N=1）のときは0
+    if reachable <= 1 or total_dist == 0:
+        return 0.0
+
+    # 基本形： (reachable-1) / sum_dist
+    score = (reachable - 1) / total_dist
+
+    # 改良補正（wf_improved=True）
+    if wf_improved and N > 1:
+        score *= (reachable - 1) / (N - 1)
+
+    return float(score)
+
+
+def betweenness_scale(n: int, normalized: bool) -> float:
+    """媒介中心性の生の累積値に掛ける係数（無向の 1/2 と正規化をまとめたもの）。"""
+    # 無向グラフは「両方向で二重に数えている」ため 2 で割る
+    scale = 0.5
+    # 正規化（NetworkX と同じ規則）：無向で係数 = 2 / ((n-1)(n-2))
+    if normalized and n > 2:
+        scale *= 2.0 / ((n - 1) * (n - 2))
+    return scale
+
+
+def use_scipy(n: int) -> bool:
+    """ノード数 n のグラフの近接中心性を SciPy の距離行列で計算するかどうか。"""
+    global np, csr_matrix, shortest_path, _have_scipy
+    if n < SCIPY_MIN_NODES or n * n > SCIPY_MAX_CELLS:
+        return False
+    if _have_scipy is None:
+        try:
+            import numpy as np
+            from scipy.sparse import csr_matrix
+            from scipy.sparse.csgraph import shortest_path
+            _have_scipy = True
+        except ImportError:
+            _have_scipy = False
+    return _have_scipy
+
+
+def csr_arrays(adj: List[List[int]]):
+    """整数添字の隣接リストを CSR の (indptr, indices)（いずれも int64 配列）に変換します。"""
+    indptr = [0]
+    indices: List[int] = []
+    for nbrs in adj:
+        indices.extend(nbrs)
+        indptr.append(len(indices))
+    return np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int64)
+
+
+def to_csr(adj: List[List[int]]):
+    """整数添字の隣接リストを対称な CSR 隣接行列（値はすべて 1.0）に変換します。"""
+    n = len(adj)
+    indptr, indices = csr_arrays(adj)
+    return csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n, n))
+
+
+def distances(A):
+    """全ノード対の最短距離行列（到達不能は inf）。"""
+    return shortest_path(A, unweighted=True, directed=False)
+
+
+def closeness_from_distances(D, wf_improved: bool) -> List[float]:
+    """距離行列から各ノードの近接中心性を求めます（closeness_score と同じ定義）。"""
+    N = D.shape[0]
+    finite = np.isfinite(D)
+    reachable = finite.sum(axis=1)
+    total = np.where(finite, D, 0.0).sum(axis=1)
+    ok = (reachable > 1) & (total > 0)
+    score = np.zeros(N)
+    score[ok] = (reachable[ok] - 1) / total[ok]
+    if wf_improved and N > 1:
+        score *= (reachable - 1) / (N - 1)
+    return score.tolist()
+
+
+def use_numba(n: int) -> bool:
+    """ノード数 n のグラフの媒介中心性を Numba のカーネルで計算するかどうか。"""
+    global np, numba, _have_numba, _brandes_csr
+    if n < NUMBA_MIN_NODES:
+        return False
+    if _have_numba is None:
+        try:
+            import numpy as np
+            import numba
+            _brandes_csr = numba.njit(cache=True)(_brandes_csr_py)
+            _have_numba = True
+        except ImportError:
+            _have_numba = False
+    return _have_numba
+
+
+def _brandes_csr_py(indptr, indices, n):
+    """
+    CSR 隣接 (indptr, indices) 上で全ソースの Brandes 法を行い、
+    (Cb, 距離総和, 到達可能ノード数) を返します。
+    Cb は accumulate_dependency で累積したものと同じ（/2・正規化前）。
+    直前ノード集合は P_head / P_next / P_to の連結リスト 1 本で持ち、
+    BFS のキューは訪問順配列 S をそのまま使います。
+    直接は呼ばず、use_numba で JIT コンパイルした _brandes_csr を使います。
+    """
+    Cb = np.zeros(n)
+    total = np.zeros(n, np.int64)
+    reach = np.zeros(n, np.int64)
+    sigma = np.zeros(n)
+    delta = np.zeros(n)
+    dist = np.full(n, -1, np.int64)
+    S = np.empty(n, np.int64)
+    P_head = np.full(n, -1, np.int64)
+    P_next = np.empty(len(indices), np.int64)
+    P_to = np.empty(len(indices), np.int64)
+
+    for s in range(n):
+        # 前向き探索（S[head:tail] がキュー）
+        sigma[s] = 1.0
+        dist[s] = 0
+        S[0] = s
+        head = 0
+        tail = 1
+        n_pred = 0
+        while head < tail:
+            v = S[head]
+            head += 1
+            dv = dist[v] + 1
+            for e in range(indptr[v], indptr[v + 1]):
+                w = indices[e]
+                if dist[w] < 0:
+                    dist[w] = dv
+                    S[tail] = w
+                    tail += 1
+                if dist[w] == dv:
+                    sigma[w] += sigma[v]
+                    P_to[n_pred] = v
+                    P_next[n_pred] = P_head[w]
+                    P_head[w] = n_pred
+                    n_pred += 1
+
+        # 依存度の逆伝播
+        dsum = 0
+        for i in range(tail - 1, -1, -1):
+            w = S[i]
+            dsum += dist[w]
+            coeff = (1.0 + delta[w]) / sigma[w]
+            k = P_head[w]
+            while k != -1:
+                v = P_to[k]
+                delta[v] += sigma[v] * coeff
+                k = P_next[k]
+            if w != s:
+                Cb[w] += delta[w]
+        total[s] = dsum
+        reach[s] = tail
+
+        # 訪問したノードの分だけ作業配列を初期化
+        for i in range(tail):
+            w = S[i]
+            sigma[w] = 0.0
+            delta[w] = 0.0
+            dist[w] = -1
+            P_head[w] = -1
+
+    return Cb, total, reach
+
+
+def brandes_numba(adj: List[List[int]]) -> Tuple[List[float], List[int], List[int]]:
+    """
+    Numba のカーネルで全ソースの Brandes 法を行い、
+    (Cb, 距離総和, 到達可能ノード数) をリストで返します（Cb は /2・正規化前）。
+    """
+    indptr, indices = csr_arrays(adj)
+    Cb, total, reach = _brandes_csr(indptr, indices, len(adj))
+    return Cb.tolist(), total.tolist(), reach.tolist()
+
+
+def all_centralities(
+    edges: List[Tuple[Hashable, Hashable]],
+    normalized: bool = True,
+    wf_improved: bool = True,
+) -> Tuple[Dict[Hashable, float], Dict[Hashable, float], Dict[Hashable, float]]:
+    """
+    次数中心性・近接中心性・媒介中心性をまとめて計算します。
+    隣接リストの構築は 1 回、BFS は各ソースにつき 1 回だけで、
+    近接中心性と媒介中心性は同じ BFS の結果から求めます。
+    定義はそれぞれ degree_centrality / closeness_centrality /
+    betweenness_centrality と同じです。
+
+    Returns
+    -------
+    tuple of dict
+        (次数中心性, 近接中心性, 媒介中心性)
+    """
+    nodes, idx, adj = build(edges)
+    n = len(nodes)
+
+    if n <= 1:
+        degree = {v: 0.0 for v in nodes}
+    else:
+        denom = float(n - 1)
+        degree = {nodes[i]: len(adj[i]) / denom for i in range(n)}
+
+    if use_numba(n):
+        # 同じカーネルの 1 回の全ソース探索から近接・媒介の両方を求める
+        Cb, total, reach = brandes_numba(adj)
+        C = [closeness_score(total[i], reach[i], n, wf_improved) for i in range(n)]
+    else:
+        C: List[float] = [0.0] * n
+        Cb: List[float] = [0.0] * n
+        delta: List[float] = [0.0] * n
+        for s, dist, sigma, P, S in bfs_all_sources(adj):
+            C[s] = closeness_score(sum(dist[i] for i in S), len(S), n, wf_improved)
+            if n > 2:
+                accumulate_dependency(s, sigma, P, S, delta, Cb)
+
+    scale = betweenness_scale(n, normalized)
+    closeness = {nodes[i]: C[i] for i in range(n)}
+    betweenness = {nodes[i]: Cb[i] * scale for i in range(n)}
+    return degree, closeness, betweenness
@@ -1,6 +1,10 @@
-from collections import deque, defaultdict
 from typing import List, Tuple, Dict, Hashable
 
+from _graph import (
+    build, bfs_all_sources, closeness_score,
+    use_scipy, to_csr, distances, closeness_from_distances,
+)
+
 def closeness_centrality(
     edges: List[Tuple[Hashable, Hashable]],
     wf_improved: bool = True,
@@ -23,51 +27,24 @@ def closeness_centrality(
     dict
         各ノード -> 近接中心性
     """
-    # --- グラフ（隣接集合）を構築 ---
-    adj: Dict[Hashable, set] = defaultdict(set)
-    for u, v in edges:
-        if u == v:
-            continue  # 自己ループは中心性に影響しないため除外
-        adj[u].add(v)
-        adj[v].add(u)
-
-    nodes = list(adj.keys())
+    # --- グラフ（整数添字の隣接リスト）を構築 ---
+    nodes, _, adj = build(edges)
     N = len(nodes)
     if N == 0:
         return {}
 
-    # --- 各ノード s から BFS で最短距離を合計 ---
-    def bfs_sum_dist(start):
-        dist = {start: 0}
-        q = deque([start])
-        while q:
-            x = q.popleft()
-            for y in adj[x]:
-                if y not in dist:
-                    dist[y] = dist[x] + 1
-                    q.append(y)
-        # 自分以外への距離の総和
-        total = sum(d for n, d in dist.items() if n != start)
-        reachable = len(dist)  # 自分を含む到達可能ノード数
-        return total, reachable
+    # --- 中規模以上で SciPy があれば、距離行列を C 実装で一括計算 ---
+    if use_scipy(N):
+        scores = closeness_from_distances(distances(to_csr(adj)), wf_improved)
+        return {nodes[i]: scores[i] for i in range(N)}
 
+    # --- 各ノード s から BFS で最短距離を合計 ---
+    # （最短路数・直前ノードは不要なので paths=False）
     C = {}
-    for s in nodes:
-        total_dist, reachable = bfs_sum_dist(s)
-
-        # 孤立ノード、到達先が自分だけ、または距離総和ゼロ（N=1）のときは0
-        if reachable <= 1 or total_dist == 0:
-            C[s] = 0.0
-            continue
-
-        # 基本形： (reachable-1) / sum_dist
-        score = (reachable - 1) / total_dist
-
-        # 改良補正（wf_improved=True）
-        if wf_improved and N > 1:
-            score *= (reachable - 1) / (N - 1)
-
-        C[s] = float(score)
+    for s, dist, sigma, P, S in bfs_all_sources(adj, paths=False):
+        total_dist = sum(dist[i] for i in S)  # 自分（距離0）以外への距離の総和
+        reachable = len(S)  # 自分を含む到達可能ノード数
+        C[nodes[s]] = closeness_score(total_dist, reachable, N, wf_improved)
 
     return C
 
@@ -9,7 +9,6 @@ from Autodesk.Revit.DB import *
 from RevitServices.Persistence import DocumentManager
 
 doc = DocumentManager.Instance.CurrentDBDocument
-ZAXIS = XYZ.BasisZ
 
 # ---------- 単位 ----------
 def mm_to_internal(mm):
@@ -33,6 +32,7 @@ OFFSET      = mm_to_internal(offset_mm)
 STEP        = mm_to_internal(sample_step_mm)
 BB_PAD      = mm_to_internal(400.0)
 OVERLAP_PAD = mm_to_internal(overlap_pad_mm)
+GRID_CELL   = mm_to_internal(1000.0)  # 壁・部屋の空間インデックス（XY グリッド）のセル寸法
 COS_TOL     = math.cos(math.radians(parallel_tol_deg))
 
 # ---------- ユーティリティ ----------
@@ -66,8 +66,9 @@ def tangent_xy(curve, param, normalized=False):
     return tvec
 
 def normal_xy_from_tangent(tvec):
-    n = ZAXIS.CrossProduct(tvec)
-    return norm_vec(n) if n.GetLength() >= 1e-12 else XYZ.BasisX
+    # Z × t = (-ty, tx, 0)。t は XY 平面上の単位ベクトルなので正規化も不要
+    tx, ty = tvec.X, tvec.Y
+    return XYZ(-ty, tx, 0.0) if (tx*tx + ty*ty) > 1e-24 else XYZ.BasisX
 
 def expand_bbox_xy(bb, pad):
     if bb is None: return None
@@ -83,25 +84,61 @@ def bbox2d_contains(bb, pt):
     x, y = pt.X, pt.Y
     return (mn.X <= x <= mx.X) and (mn.Y <= y <= mx.Y)
 
-def candidate_rooms(pt, room_bbs):
-    return [r for (r, bb) in room_bbs if bbox2d_contains(bb, pt)]
+def cell_of(x, y):
+    return (int(math.floor(x / GRID_CELL)), int(math.floor(y / GRID_CELL)))
+
+def candidate_rooms(pt, room_grid):
+    # pt のセルに登録された部屋だけを BBox で絞り込む（BBox 不明の部屋は常に候補）
+    cands = [r for (r, bb) in room_grid.get(cell_of(pt.X, pt.Y), ()) if bbox2d_contains(bb, pt)]
+    cands.extend(rooms_without_bb)
+    return cands
+
+def rooms_near_bbox(bb, room_grid):
+    # bb = (minx, miny, maxx, maxy) と膨張BBoxが交差する部屋（Id -> Room）
+    found = {}
+    cx0, cy0 = cell_of(bb[0], bb[1])
+    cx1, cy1 = cell_of(bb[2], bb[3])
+    for cx in range(cx0, cx1 + 1):
+        for cy in range(cy0, cy1 + 1):
+            for r, rbb in room_grid.get((cx, cy), ()):
+                mn, mx = rbb.Min, rbb.Max
+                if mx.X < bb[0] or mn.X > bb[2] or mx.Y < bb[1] or mn.Y > bb[3]:
+                    continue
+                found[r.Id.IntegerValue] = r
+    for r in rooms_without_bb:
+        found[r.Id.IntegerValue] = r
+    return found
+
+def point_in_room(r, bb, pt):
+    if not bbox2d_contains(bb, pt): return False
+    try:
+        return r.IsPointInRoom(pt)
+    except:
+        return False
 
-def room_at_point_prefiltered(pt, room_bbs):
-    for r in candidate_rooms(pt, room_bbs):
+def room_at_point_prefiltered(pt, room_grid, exclude_id=None):
+    for r in candidate_rooms(pt, room_grid):
+        if exclude_id is not None and r.Id.IntegerValue == exclude_id:
+            continue
         try:
             if r.IsPointInRoom(pt):
                 return r
         except: pass
     return None
 
+def midpoint_sample(curve):
+    return (curve.Evaluate(0.5, True), tangent_xy(curve, 0.5, normalized=True))
+
 # 弧長 STEP ピッチでサンプリング
+# 点と一緒にその位置の接線（テッセレーション折れ線の区間方向）も返すので、
+# 呼び出し側で Project / ComputeDerivatives をやり直す必要はない
 def length_uniform_samples(curve, step_len):
-    pts = []
+    samples = []  # [(点, 単位接線), ...]
     poly = curve.Tessellate()
     if not poly or len(poly) < 2:
-        try: pts.append(curve.Evaluate(0.5, True))
+        try: samples.append(midpoint_sample(curve))
         except: pass
-        return pts
+        return samples
 
     cum = [0.0]
     for i in range(1, len(poly)):
@@ -109,9 +146,9 @@ def length_uniform_samples(curve, step_len):
         cum.append(cum[-1] + seg_len)
     total = cum[-1]
     if total < 1e-8:
-        try: pts.append(curve.Evaluate(0.5, True))
+        try: samples.append(midpoint_sample(curve))
         except: pass
-        return pts
+        return samples
 
     n = max(1, int(total / step_len))
     targets = [total * (k / float(n + 1)) for k in range(1, n + 1)]
@@ -125,12 +162,12 @@ def length_uniform_samples(curve, step_len):
         t = 0.5 if (d1 - d0) < 1e-12 else (d - d0) / (d1 - d0)
         vec = poly[j].Subtract(poly[j-1])
         p = poly[j-1].Add(vec.Multiply(t))
-        pts.append(p)
+        samples.append((p, norm_vec(vec)))
 
-    if not pts:
-        try: pts.append(curve.Evaluate(0.5, True))
+    if not samples:
+        try: samples.append(midpoint_sample(curve))
         except: pass
-    return pts
+    return samples
 
 # ---------- 壁データ ----------
 def wall_half_thickness(wall):
@@ -144,6 +181,14 @@ def wall_half_thickness(wall):
     except: pass
     return mm_to_internal(50.0)
 
+def curve_bbox_xy(curve, pad):
+    try: pts = curve.Tessellate()
+    except: pts = None
+    if not pts or len(pts) < 2:
+        pts = [curve.GetEndPoint(0), curve.GetEndPoint(1)]
+    xs = [p.X for p in pts]; ys = [p.Y for p in pts]
+    return (min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad)
+
 walls = list(FilteredElementCollector(doc).OfClass(Wall).WhereElementIsNotElementType())
 walls_data = []
 for w in walls:
@@ -155,18 +200,47 @@ for w in walls:
                 walls_data.append((w, c, wall_half_thickness(w)))
     except: pass
 
-def is_overlapped_with_wall(pm, rsl_tangent, walls_data):
-    for w, wc, half_t in walls_data:
+# 壁ごとの派生量はここで 1 回だけ求めておく
+#   pad_sq : (厚さ/2 + 許容)^2（距離判定を sqrt なしの二乗比較で行う）
+#   tx, ty : 直線壁の単位接線（曲線壁は None → 投影位置で都度計算）
+# 壁を XY グリッドに登録（壁芯の BBox を 厚さ/2 + 許容 で膨張させ、重なる全セルへ）
+# → 判定時はサンプル点のセルに登録された壁だけを調べればよい
+wall_grid = {}  # (cx, cy) -> [(wc, bbox, pad_sq, tx, ty), ...]
+for w, wc, half_t in walls_data:
+    pad = half_t + OVERLAP_PAD
+    tx = ty = None
+    if isinstance(wc, Line):
+        d = wc.Direction
+        dl = (d.X*d.X + d.Y*d.Y) ** 0.5
+        if dl > 1e-12:
+            tx = d.X / dl; ty = d.Y / dl
+    bb = curve_bbox_xy(wc, pad)
+    entry = (wc, bb, pad * pad, tx, ty)
+    cx0, cy0 = cell_of(bb[0], bb[1])
+    cx1, cy1 = cell_of(bb[2], bb[3])
+    for cx in range(cx0, cx1 + 1):
+        for cy in range(cy0, cy1 + 1):
+            wall_grid.setdefault((cx, cy), []).append(entry)
+
+def is_overlapped_with_wall(pm, rsl_tangent, wall_grid):
+    x, y = pm.X, pm.Y
+    rx, ry = rsl_tangent.X, rsl_tangent.Y
+    for wc, bb, pad_sq, tx, ty in wall_grid.get(cell_of(x, y), ()):
+        # 膨張 BBox の外なら Project（重い API）を呼ぶまでもなく対象外
+        if not (bb[0] <= x <= bb[2] and bb[1] <= y <= bb[3]):
+            continue
         prj = wc.Project(pm)
         if not prj: 
             continue
         q = prj.XYZPoint
-        dx = pm.X - q.X; dy = pm.Y - q.Y
-        dist_xy = (dx*dx + dy*dy) ** 0.5
-        if dist_xy > (half_t + OVERLAP_PAD):
+        dx = x - q.X; dy = y - q.Y
+        if dx*dx + dy*dy > pad_sq:
             continue
-        w_tan = tangent_xy(wc, prj.Parameter, normalized=False)
-        if abs(rsl_tangent.DotProduct(w_tan)) >= COS_TOL:
+        if tx is not None:
+            dot = rx*tx + ry*ty
+        else:
+            dot = rsl_tangent.DotProduct(tangent_xy(wc, prj.Parameter, normalized=False))
+        if abs(dot) >= COS_TOL:
             return True
     return False
 
@@ -194,6 +268,20 @@ for r in rooms:
     except:
         bb = None
     room_bbs.append((r, bb))
+room_bb_of = dict((r.Id.IntegerValue, bb) for (r, bb) in room_bbs)
+
+# 壁と同じ XY グリッドに部屋の膨張BBoxを登録（全部屋の線形走査を避ける）
+room_grid = {}  # (cx, cy) -> [(r, bb), ...]
+rooms_without_bb = []
+for r, bb in room_bbs:
+    if bb is None:
+        rooms_without_bb.append(r)
+        continue
+    cx0, cy0 = cell_of(bb.Min.X, bb.Min.Y)
+    cx1, cy1 = cell_of(bb.Max.X, bb.Max.Y)
+    for cx in range(cx0, cx1 + 1):
+        for cy in range(cy0, cy1 + 1):
+            room_grid.setdefault((cx, cy), []).append((r, bb))
 
 # ---------- メイン（RSLのみを対象） ----------
 opt = SpatialElementBoundaryOptions()
@@ -201,18 +289,46 @@ opt.SpatialElementBoundaryLocation = SpatialElementBoundaryLocation.Finish
 
 pair_flags = {}  # key -> {"clean":bool, "dirty":bool}
 
+def pair_key(ida, idb):
+    return (ida, idb) if ida < idb else (idb, ida)
+
+def is_clean_pair(ida, idb):
+    flags = pair_flags.get(pair_key(ida, idb))
+    return bool(flags and flags["clean"])
+
 def mark_pair(a, b, clean_sample):
-    ida = a.Id.IntegerValue; idb = b.Id.IntegerValue
-    key = (ida, idb) if ida < idb else (idb, ida)
+    key = pair_key(a.Id.IntegerValue, b.Id.IntegerValue)
     flags = pair_flags.get(key, {"clean": False, "dirty": False})
     if clean_sample: flags["clean"] = True
     else:            flags["dirty"] = True
     pair_flags[key] = flags
 
+def rsl_segment_key(rsl_id, curve):
+    # 同じ RSL の同じ区間なら、どちらの部屋から見ても同じキー（端点は向きを無視）
+    p0, p1 = curve.GetEndPoint(0), curve.GetEndPoint(1)
+    a = (round(p0.X, 6), round(p0.Y, 6))
+    b = (round(p1.X, 6), round(p1.Y, 6))
+    return (rsl_id, a, b) if a <= b else (rsl_id, b, a)
+
+# RSL の Id を先に一括取得しておき、境界セグメントごとの doc.GetElement ＋
+# カテゴリ判定を int の集合引きに置き換える（壁など RSL 以外の境界が大半のため）
+rsl_ids = frozenset(
+    i.IntegerValue for i in
+    FilteredElementCollector(doc)
+    .OfCategory(BuiltInCategory.OST_RoomSeparationLines)
+    .WhereElementIsNotElementType()
+    .ToElementIds()
+)
+
+# --- 1 パス目：RSL 区間ごとに、それを境界に持つ部屋を集める ---
+# RSL は両側の部屋の境界に 1 回ずつ現れるので、部屋ごとにサンプリングすると
+# 同じ区間を 2 回調べることになる。区間単位にまとめて 1 回だけ調べる。
+rsl_segments = {}  # key -> (curve, [owner rooms])
 for rm in rooms:
     segloops = rm.GetBoundarySegments(opt)
     if not segloops: 
         continue
+    rm_id = rm.Id.IntegerValue
 
     for loop in segloops:
         for seg in loop:
@@ -220,11 +336,7 @@ for rm in rooms:
             eid = seg.ElementId
             if not eid or eid == ElementId.InvalidElementId:
                 continue
-            host = doc.GetElement(eid)
-            if not isinstance(host, CurveElement):
-                continue
-            cat = host.Category
-            if not cat or cat.Id.IntegerValue != int(BuiltInCategory.OST_RoomSeparationLines):
+            if eid.IntegerValue not in rsl_ids:
                 continue
 
             # RSL の実曲線で判定
@@ -232,25 +344,63 @@ for rm in rooms:
             if c is None or c.Length < 1e-8:
                 continue
 
-            for pm in length_uniform_samples(c, STEP):
-                prj = c.Project(pm)
-                tparam = prj.Parameter if prj else 0.5
-                tvec = tangent_xy(c, tparam, normalized=False)
-                nvec = normal_xy_from_tangent(tvec)
-
-                pL = pm.Add(nvec.Multiply(OFFSET))
-                pR = pm.Add(nvec.Negate().Multiply(OFFSET))
-
-                left  = room_at_point_prefiltered(pL, room_bbs)
-                right = room_at_point_prefiltered(pR, room_bbs)
-
-                # rm と向かい合う相手が見つかった場合のみ、壁重なりを評価
-                if left is rm and right is not None and right.Id != rm.Id:
-                    overlapped = is_overlapped_with_wall(pm, tvec, walls_data)
-                    mark_pair(rm, right, clean_sample=(not overlapped))
-                elif right is rm and left is not None and left.Id != rm.Id:
-                    overlapped = is_overlapped_with_wall(pm, tvec, walls_data)
-                    mark_pair(rm, left, clean_sample=(not overlapped))
+            key = rsl_segment_key(eid.IntegerValue, c)
+            entry = rsl_segments.get(key)
+            if entry is None:
+                rsl_segments[key] = (c, [rm])
+            elif all(o.Id.IntegerValue != rm_id for o in entry[1]):
+                entry[1].append(rm)
+
+# --- 2 パス目：RSL 区間ごとに 1 回だけサンプリング ---
+for c, owners in rsl_segments.values():
+    # RSL 周辺（OFFSET + STEP で膨張）に部屋が 2 つ以上無ければ組は作れない
+    near = rooms_near_bbox(curve_bbox_xy(c, OFFSET + STEP), room_grid)
+    if len(near) < 2:
+        continue
+
+    # 周辺の部屋がちょうど 2 つなら、作れる組はその 1 組だけ。
+    # 出力に効くのは clean フラグのみなので、既に clean な組なら
+    # この区間は調べる必要がなく、見つかった時点で打ち切ってよい。
+    single_pair = len(near) == 2
+    if single_pair and is_clean_pair(*near.keys()):
+        continue
+
+    owner_bbs = [(o, room_bb_of.get(o.Id.IntegerValue)) for o in owners]
+
+    for pm, tvec in length_uniform_samples(c, STEP):
+        nvec = normal_xy_from_tangent(tvec)
+
+        pL = pm.Add(nvec.Multiply(OFFSET))
+        pR = pm.Add(nvec.Negate().Multiply(OFFSET))
+
+        # まずこの区間を境界に持つ部屋（本命）が左右どちらにあるかを判定
+        left = right = None
+        spans_both = False
+        for o, obb in owner_bbs:
+            in_left  = point_in_room(o, obb, pL)
+            in_right = point_in_room(o, obb, pR)
+            if in_left and in_right:
+                spans_both = True  # 両側とも同じ部屋 → 組にならない
+                break
+            if in_left:  left = o
+            if in_right: right = o
+            if left is not None and right is not None:
+                break
+        if spans_both or (left is None and right is None):
+            continue
+
+        # 片側しか決まらなければ、反対側だけを候補部屋から探す
+        if left is None:
+            left = room_at_point_prefiltered(pL, room_grid, exclude_id=right.Id.IntegerValue)
+        elif right is None:
+            right = room_at_point_prefiltered(pR, room_grid, exclude_id=left.Id.IntegerValue)
+
+        # 向かい合う 2 部屋が見つかった場合のみ、壁重なりを評価
+        if left is not None and right is not None and left.Id != right.Id:
+            overlapped = is_overlapped_with_wall(pm, tvec, wall_grid)
+            mark_pair(left, right, clean_sample=(not overlapped))
+            if single_pair and not overlapped:
+                break
 
 # ---------- 出力 ----------
 pairs = []
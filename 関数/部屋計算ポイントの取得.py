@@ -22,25 +22,29 @@ phase = doc.GetElement(phase_param.AsElementId()) if phase_param else None
 seq = doors if isinstance(doors, (list, tuple)) else [doors]
 
 
-def get_rooms(inst):
-    """FamilyInstance から [FromRoom, ToRoom] を返す。取得不可は None。"""
+def _gr_fallback(inst):
+    """FamilyInstance から [FromRoom, ToRoom] を返す（Dynamo 側の簡易プロパティ）。"""
     if inst is None:
         return [None, None]
+    return [getattr(inst, "FromRoom", None), getattr(inst, "ToRoom", None)]
 
-    # RevitAPI のメソッドがあれば優先（フェーズを明示して精度確保）
-    has_get = hasattr(inst, "get_FromRoom") and hasattr(inst, "get_ToRoom")
-    if has_get and phase is not None:
-        fr = inst.get_FromRoom(phase)
-        tr = inst.get_ToRoom(phase)
-        return [fr, tr]
 
-    # フォールバック：Dynamo 側の簡易プロパティ
-    fr = inst.FromRoom if hasattr(inst, "FromRoom") else None
-    tr = inst.ToRoom if hasattr(inst, "ToRoom") else None
-    return [fr, tr]
+def _gr_phase(inst):
+    """FamilyInstance から [FromRoom, ToRoom] を返す（フェーズを明示して精度確保）。"""
+    if inst is None:
+        return [None, None]
+    try:
+        return [inst.get_FromRoom(phase), inst.get_ToRoom(phase)]
+    except AttributeError:
+        # RevitAPI のメソッドを持たない要素だけフォールバック
+        return _gr_fallback(inst)
+
+
+# 経路はフェーズの有無で 1 回だけ決める（要素ごとの hasattr 判定をしない）
+get_rooms = _gr_phase if phase is not None else _gr_fallback
 
-# ループ最小化（内包表記）
-result = [get_rooms(d) for d in seq]
+# ループ最小化
+result = list(map(get_rooms, seq))
 
 # --- 出力（元コード互換） ---
 OUT = result if isinstance(doors, (list, tuple)) else (result[0] if result else [None, None])